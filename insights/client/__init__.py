@@ -15,8 +15,7 @@ from . import client
 from .constants import InsightsConstants as constants
 from .config import InsightsConfig
 from .auto_config import try_auto_configuration
-from .utilities import (delete_registered_file,
-                        delete_unregistered_file,
+from .utilities import (reset_registration_state,
                         write_data_to_file,
                         write_to_disk,
                         generate_machine_id,
@@ -96,7 +95,7 @@ class InsightsClient(object):
         """
             returns (dict): {'remote_leaf': -1, 'remote_branch': -1}
         """
-        return client.get_branch_info(self.config, self.connection)
+        return client.get_branch_info(self.config)
 
     @_net
     def get_egg_url(self):
@@ -542,9 +541,9 @@ class InsightsClient(object):
         '''
         Deletes dotfiles and machine-id for fresh registration
         '''
-        delete_registered_file()
-        delete_unregistered_file()
-        write_to_disk(constants.machine_id_file, delete=True)
+        reset_registration_state()
+        if self.connection:
+            client.clear_registration_status(self.connection)
         logger.debug('Re-register set, forcing registration.')
         logger.debug('New machine-id: %s', generate_machine_id(new=True))
 
@@ -2,9 +2,13 @@ from __future__ import print_function
 from __future__ import absolute_import
 import sys
 import json
+import atexit
+import errno
+import functools
 import logging
 import logging.handlers
 import os
+import random
 import time
 import six
 
@@ -12,10 +16,10 @@ from .utilities import (generate_machine_id,
                         write_to_disk,
                         write_registered_file,
                         write_unregistered_file,
-                        delete_registered_file,
-                        delete_unregistered_file,
                         delete_cache_files,
-                        determine_hostname)
+                        determine_hostname,
+                        reset_registration_state,
+                        flush_log_handlers)
 from .collection_rules import InsightsUploadConf
 from .data_collector import DataCollector
 from .core_collector import CoreCollector
@@ -27,25 +31,51 @@ from .schedule import get_scheduler
 
 NETWORK = constants.custom_network_log_level
 LOG_FORMAT = ("%(asctime)s %(levelname)8s %(name)s %(message)s")
+# formatters are stateless, so every handler set up here shares these
+_FILE_FMT = logging.Formatter(LOG_FORMAT)
+_VERBOSE_FMT = _FILE_FMT
+_TERSE_FMT = logging.Formatter("%(message)s")
+# number of records held in memory before they are written to the log file
+LOG_BUFFER_CAPACITY = 512
+# seconds, starting ceiling of the randomized wait between upload attempts
+RETRY_BACKOFF_BASE = 0.5
+# seconds a registration check result is reused for
+REG_CHECK_TTL = 60
 logger = logging.getLogger(__name__)
 
+# time.monotonic is not available on python 2
+_monotonic = getattr(time, 'monotonic', time.time)
+
 
 def do_log_rotation():
-    handler = get_file_handler()
-    return handler.doRollover()
+    '''
+    Roll over the log file behind the buffered handler set up by
+    set_up_logging, writing out any buffered records first
+    '''
+    for handler in logging.root.handlers:
+        if isinstance(handler, logging.handlers.MemoryHandler):
+            handler.flush()
+            return handler.target.doRollover()
 
 
 def get_file_handler(config):
     log_file = config.logging_file
     log_dir = os.path.dirname(log_file)
-    if not log_dir:
-        log_dir = os.getcwd()
-    elif not os.path.exists(log_dir):
-        os.makedirs(log_dir, 0o700)
+    if log_dir:
+        try:
+            os.makedirs(log_dir, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
     file_handler = logging.handlers.RotatingFileHandler(
         log_file, backupCount=3)
-    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
-    return file_handler
+    file_handler.setFormatter(_FILE_FMT)
+    # batch records so the log file is not written once per record,
+    # anything at ERROR or above is written out immediately
+    buffered_handler = logging.handlers.MemoryHandler(
+        LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler)
+    atexit.register(buffered_handler.flush)
+    return buffered_handler
 
 
 def get_console_handler(config):
@@ -63,18 +93,22 @@ def get_console_handler(config):
     handler = logging.StreamHandler(sys.stdout)
     handler.setLevel(target_level)
 
-    log_format = LOG_FORMAT if config.verbose else "%(message)s"
-    handler.setFormatter(logging.Formatter(log_format))
+    handler.setFormatter(_VERBOSE_FMT if config.verbose else _TERSE_FMT)
 
     return handler
 
 
 def configure_level(config):
-    config_level = 'NETWORK' if config.net_debug else config.loglevel
-    config_level = 'DEBUG' if config.verbose else config.loglevel
+    # same precedence as get_console_handler
+    if config.verbose:
+        config_level = 'DEBUG'
+    elif config.net_debug:
+        config_level = 'NETWORK'
+    else:
+        config_level = config.loglevel
 
     init_log_level = logging.getLevelName(config_level)
-    if type(init_log_level) in six.string_types:
+    if isinstance(init_log_level, six.string_types):
         print("Invalid log level %s, defaulting to DEBUG" % config_level)
         init_log_level = logging.DEBUG
 
@@ -85,6 +119,19 @@ def configure_level(config):
         logging.getLogger('insights.core.dr').setLevel(logging.WARNING)
 
 
+def _flush_logs(func):
+    '''
+    Flush buffered log records once the wrapped function returns or raises
+    '''
+    @functools.wraps(func)
+    def _wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            flush_log_handlers()
+    return _wrapper
+
+
 def set_up_logging(config):
     logging.addLevelName(NETWORK, "NETWORK")
     if len(logging.root.handlers) == 0:
@@ -122,9 +169,8 @@ def _legacy_handle_registration(config, pconn):
     # force-reregister -- remove machine-id files and registration files
     # before trying to register again
     if config.reregister:
-        delete_registered_file()
-        delete_unregistered_file()
-        write_to_disk(constants.machine_id_file, delete=True)
+        reset_registration_state()
+        clear_registration_status(pconn)
         logger.debug('Re-register set, forcing registration.')
 
     logger.debug('Machine-id: %s', generate_machine_id(new=config.reregister))
@@ -163,6 +209,7 @@ def _legacy_handle_registration(config, pconn):
                         hostname, display_name, group)
         if message:
             logger.info(message)
+        clear_registration_status(pconn)
         write_registered_file()
         return True
     else:
@@ -196,8 +243,40 @@ def get_registration_status(config, pconn):
             True - machine is registered
             False - machine is unregistered
             None - could not reach the API
+
+        The result is kept on the connection for REG_CHECK_TTL seconds,
+        so repeated checks within that time ask the API only once.
+        Results where the API could not be reached are not kept.
+        On the platform a cached hit still resyncs .registered and
+        .unregistered, as registration_check does. On the legacy path the
+        local record message is the one from the original check.
+    '''
+    cached = getattr(pconn, '_cached_reg_check', None)
+    if cached is not None and _monotonic() - cached[0] < REG_CHECK_TTL:
+        check = cached[1]
+        if not pconn.config.legacy_upload:
+            if check:
+                write_registered_file()
+            else:
+                write_unregistered_file()
+        return check
+
+    check = registration_check(pconn)
+    if isinstance(check, dict):
+        # legacy
+        unreachable = check['unreachable']
+    else:
+        unreachable = check is None
+    if not unreachable:
+        pconn._cached_reg_check = (_monotonic(), check)
+    return check
+
+
+def clear_registration_status(pconn):
+    '''
+    Forget the cached registration check once the registration changes
     '''
-    return registration_check(pconn)
+    pconn._cached_reg_check = None
 
 
 # -LEGACY-
@@ -224,6 +303,7 @@ def _legacy_handle_unregistration(config, pconn):
 
     if check['status']:
         unreg = pconn.unregister()
+        clear_registration_status(pconn)
     else:
         unreg = True
         logger.info('This system is already unregistered.')
@@ -244,6 +324,7 @@ def handle_unregistration(config, pconn):
         return _legacy_handle_unregistration(config, pconn)
 
     unreg = pconn.unregister()
+    clear_registration_status(pconn)
     if unreg or config.force:
         # only set if unreg was successful or --force was set
         write_unregistered_file()
@@ -268,6 +349,9 @@ def get_branch_info(config):
     """
     Get branch info for a system
     returns (dict): {'remote_branch': -1, 'remote_leaf': -1}
+
+    Nothing is copied or rebuilt: the same dict object is returned on
+    every call for a given config, so callers may compare results with `is`.
     """
     # in the case we are running on offline mode
     # or we are analyzing a running container/image
@@ -277,6 +361,22 @@ def get_branch_info(config):
     return config.branch_info
 
 
+def _call_concurrently(*funcs):
+    '''
+    Call each of funcs and return their results in the same order.
+    The calls run in parallel threads when concurrent.futures exists,
+    one after another otherwise.
+    '''
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        return [func() for func in funcs]
+    with ThreadPoolExecutor(max_workers=len(funcs)) as pool:
+        futures = [pool.submit(func) for func in funcs]
+        return [future.result() for future in futures]
+
+
+@_flush_logs
 def collect(config, pconn):
     """
     All the heavy lifting done here
@@ -285,7 +385,15 @@ def collect(config, pconn):
     pc = InsightsUploadConf(config)
     output = None
 
-    rm_conf = pc.get_rm_conf()
+    if config.core_collect:
+        collection_rules = None
+        rm_conf = pc.get_rm_conf()
+    else:
+        # reading the collection rules verifies their GPG signature in a
+        # subprocess, overlap that with loading the redaction config
+        rm_conf, collection_rules = _call_concurrently(pc.get_rm_conf,
+                                                       pc.get_conf_file)
+    # the report is built from the rm_conf loaded above
     blacklist_report = pc.create_report()
     if rm_conf:
         logger.warn("WARNING: Excluding data from files")
@@ -294,10 +402,8 @@ def collect(config, pconn):
 
     msg_name = determine_hostname(config.display_name)
     if config.core_collect:
-        collection_rules = None
         dc = CoreCollector(config, archive)
     else:
-        collection_rules = pc.get_conf_file()
         dc = DataCollector(config, archive)
     logger.info('Starting to collect Insights data for %s', msg_name)
     dc.run_collection(collection_rules, rm_conf, branch_info, blacklist_report)
@@ -309,21 +415,60 @@ def get_connection(config):
     return InsightsConnection(config)
 
 
+def _backoff(attempt):
+    '''
+    Seconds to wait before retrying a failed upload
+
+    The ceiling doubles with each attempt, up to constants.sleep_time, and
+    the actual wait is drawn at random beneath it so that hosts failing
+    together do not retry together.
+    '''
+    return random.uniform(0, min(constants.sleep_time,
+                                 RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def _upload_deadline(config):
+    '''
+    Monotonic time by which the upload and its retries must be done
+    '''
+    if config.upload_deadline is None:
+        return float('inf')
+    return _monotonic() + config.upload_deadline
+
+
+def _retry_wait(config, deadline, tries):
+    '''
+    Seconds to wait before the next upload attempt, never past the deadline
+    '''
+    remaining = deadline - _monotonic()
+    if remaining <= 0:
+        logger.error("Upload deadline of %s seconds exceeded!", config.upload_deadline)
+        logger.error("Please see %s for additional information", config.logging_file)
+        raise RuntimeError('Upload deadline exceeded.')
+    return min(_backoff(tries), remaining)
+
+
+def _is_client_error(status_code):
+    '''
+    4xx responses will not succeed on retry, other than the transient
+    408 Request Timeout and 429 Too Many Requests
+    '''
+    return 400 <= status_code < 500 and status_code not in (408, 429)
+
+
 def _legacy_upload(config, pconn, tar_file, content_type, collection_duration=None):
     logger.info('Uploading Insights data.')
     api_response = None
+    deadline = _upload_deadline(config)
     for tries in range(config.retries):
         upload = pconn.upload_archive(tar_file, '', collection_duration)
 
         if upload.status_code in (200, 201):
-            api_response = json.loads(upload.text)
-
-            # Write to last upload file
-            with open(constants.last_upload_results_file, 'w') as handler:
-                if six.PY3:
-                    handler.write(upload.text)
-                else:
-                    handler.write(upload.text.encode('utf-8'))
+            api_response = json.loads(upload.content)
+
+            # Write to last upload file, as received
+            with open(constants.last_upload_results_file, 'wb') as handler:
+                handler.write(upload.content)
             write_to_disk(constants.lastupload_file)
 
             msg_name = determine_hostname(config.display_name)
@@ -338,16 +483,16 @@ def _legacy_upload(config, pconn, tar_file, content_type, collection_duration=No
                 logger.info('View the Red Hat Insights console at https://cloud.redhat.com/insights/')
             break
 
-        elif upload.status_code in (412, 413):
+        elif _is_client_error(upload.status_code):
             pconn.handle_fail_rcs(upload)
             raise RuntimeError('Upload failed.')
         else:
             logger.error("Upload attempt %d of %d failed! Status Code: %s",
                          tries + 1, config.retries, upload.status_code)
             if tries + 1 != config.retries:
-                logger.info("Waiting %d seconds then retrying",
-                            constants.sleep_time)
-                time.sleep(constants.sleep_time)
+                wait = _retry_wait(config, deadline, tries)
+                logger.info("Waiting %.1f seconds then retrying", wait)
+                time.sleep(wait)
             else:
                 logger.error("All attempts to upload have failed!")
                 logger.error("Please see %s for additional information", config.logging_file)
@@ -355,10 +500,12 @@ def _legacy_upload(config, pconn, tar_file, content_type, collection_duration=No
     return api_response
 
 
+@_flush_logs
 def upload(config, pconn, tar_file, content_type, collection_duration=None):
     if config.legacy_upload:
         return _legacy_upload(config, pconn, tar_file, content_type, collection_duration)
     logger.info('Uploading Insights data.')
+    deadline = _upload_deadline(config)
     for tries in range(config.retries):
         upload = pconn.upload_archive(tar_file, content_type, collection_duration)
 
@@ -370,16 +517,16 @@ def upload(config, pconn, tar_file, content_type, collection_duration=None):
                 # direct to console after register + upload
                 logger.info('View the Red Hat Insights console at https://cloud.redhat.com/insights/')
             return
-        elif upload.status_code in (413, 415):
+        elif _is_client_error(upload.status_code):
             pconn.handle_fail_rcs(upload)
             raise RuntimeError('Upload failed.')
         else:
             logger.error("Upload attempt %d of %d failed! Status code: %s",
                          tries + 1, config.retries, upload.status_code)
             if tries + 1 != config.retries:
-                logger.info("Waiting %d seconds then retrying",
-                            constants.sleep_time)
-                time.sleep(constants.sleep_time)
+                wait = _retry_wait(config, deadline, tries)
+                logger.info("Waiting %.1f seconds then retrying", wait)
+                time.sleep(wait)
             else:
                 logger.error("All attempts to upload have failed!")
                 logger.error("Please see %s for additional information", config.logging_file)
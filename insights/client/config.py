@@ -322,7 +322,7 @@ DEFAULT_OPTS = {
     'retries': {
         'default': 1,
         'opt': ['--retry'],
-        'help': ('Number of times to retry uploading. %s seconds between tries' %
+        'help': ('Number of times to retry uploading. Up to %s seconds between tries' %
                  constants.sleep_time),
         'action': 'store',
         'type': int,
@@ -378,6 +378,11 @@ DEFAULT_OPTS = {
         'action': 'store_true',
         'group': 'actions'
     },
+    'upload_deadline': {
+        # non-CLI
+        # seconds an upload, including its retries, may take. None for no limit
+        'default': None
+    },
     'upload_url': {
         # non-CLI
         'default': None
@@ -547,11 +552,11 @@ class InsightsConfig(object):
                                  if k.upper().startswith("INSIGHTS_") and
                                  k.upper() not in ignore)
 
-        for k in ['retries', 'cmd_timeout', 'http_timeout']:
+        for k in ['retries', 'cmd_timeout', 'http_timeout', 'upload_deadline']:
             if k in insights_env_opts:
                 v = insights_env_opts[k]
                 try:
-                    insights_env_opts[k] = float(v) if k == 'http_timeout' else int(v)
+                    insights_env_opts[k] = float(v) if k in ('http_timeout', 'upload_deadline') else int(v)
                 except ValueError:
                     raise ValueError(
                         'ERROR: Invalid value specified for {0}: {1}.'.format(k, v))
@@ -628,7 +633,7 @@ class InsightsConfig(object):
             try:
                 if key == 'retries' or key == 'cmd_timeout':
                     d[key] = parsedconfig.getint(constants.app_name, key)
-                if key == 'http_timeout':
+                if key == 'http_timeout' or key == 'upload_deadline':
                     d[key] = parsedconfig.getfloat(constants.app_name, key)
                 if key in DEFAULT_BOOLS and isinstance(
                         d[key], six.string_types):
@@ -15,7 +15,9 @@ from subprocess import Popen, PIPE, STDOUT
 
 from .constants import InsightsConstants as constants
 from .connection import InsightsConnection
-from .utilities import write_registered_file, write_unregistered_file
+from .utilities import (write_registered_file,
+                        write_unregistered_file,
+                        flush_log_handlers)
 
 APP_NAME = constants.app_name
 logger = logging.getLogger(__name__)
@@ -79,6 +81,8 @@ class InsightsSupport(object):
         logger.info('Collecting logs...')
         self._support_diag_dump()
         logger.info('Copying Insights logs to archive...')
+        # the diagnostics above must be in the log file before it is archived
+        flush_log_handlers()
         log_archive_dir = tempfile.mkdtemp(prefix='/var/tmp/')
         tar_file = os.path.join(log_archive_dir,
                                 'insights-client-logs-' +
@@ -37,6 +37,14 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def flush_log_handlers():
+    """
+    Write out any log records buffered by the root handlers
+    """
+    for handler in logging.root.handlers:
+        handler.flush()
+
+
 def determine_hostname(display_name=None):
     """
     Find fqdn if we can
@@ -109,6 +117,27 @@ def delete_unregistered_file():
         write_to_disk(f, delete=True)
 
 
+def reset_registration_state():
+    """
+    Remove the registration records and machine-id before re-registering,
+    listing each containing directory once instead of checking every file
+    """
+    reset_files = list(constants.registered_files)
+    reset_files.extend(constants.unregistered_files)
+    reset_files.append(constants.machine_id_file)
+    by_dir = {}
+    for f in reset_files:
+        by_dir.setdefault(os.path.dirname(f), set()).add(os.path.basename(f))
+    for directory, names in by_dir.items():
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            # directory does not exist, nothing to remove
+            continue
+        for name in names.intersection(entries):
+            os.remove(os.path.join(directory, name))
+
+
 def delete_cache_files():
     for f in glob.glob(os.path.join(constants.insights_core_lib_dir, "*.json")):
         os.remove(f)
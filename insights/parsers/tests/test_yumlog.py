@@ -38,6 +38,12 @@ May 23 16:09:09 Erased: redhat-access-insights-batch
 Jan 24 00:24:11 Updated: glibc-devel-2.12-1.149.el6_6.4.i686
 """.strip()
 
+OKAY3 = """
+May  3 18:06:24 Installed: wget-1.14-10.el7_0.1.x86_64
+May  3 18:06:25 some other message
+May  3 18:06:26 Erased: katello-agent
+""".strip()
+
 THROWS_PARSEEXCEPTION = """
 Jan 24 00:24:09 Updated:
 """
@@ -93,3 +99,12 @@ def test_erased():
 
     yl2 = YumLog(context_wrap(OKAY2))
     assert any(e.pkg.name == "systemd" for e in yl2) is True
+
+
+def test_skipped_lines():
+    yl = YumLog(context_wrap(OKAY3))
+    assert len(yl) == 2
+    assert [e.idx for e in yl] == [0, 2]
+    assert yl.data[0].timestamp == 'May 3 18:06:24'
+    assert yl.data[1].state == YumLog.ERASED
+    assert yl.data[1].pkg.name == 'katello-agent'
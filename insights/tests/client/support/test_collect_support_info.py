@@ -1,5 +1,8 @@
 # -*- coding: UTF-8 -*-
 
+import logging
+
+from insights.client.client import get_file_handler
 from insights.client.config import InsightsConfig
 from insights.client.connection import InsightsConnection
 from insights.client.support import InsightsSupport, registration_check
@@ -136,3 +139,36 @@ def test_registration_check_legacy_registered(_, __):
     check = registration_check(conn)
     assert isinstance(check, dict)
     assert check['status'] is True
+
+
+@patch('insights.client.client.atexit.register', Mock())
+@patch("insights.client.support.tempfile.mkdtemp")
+@patch("insights.client.support.subprocess")
+@patch("insights.client.support.InsightsSupport._support_diag_dump")
+def test_collect_support_info_flushes_log(support_diag_dump, subprocess, mkdtemp, tmpdir):
+    '''
+        Buffered log records are written out before the logs are archived
+    '''
+    log_file = str(tmpdir.join('insights-client.log'))
+    mkdtemp.return_value = str(tmpdir)
+    support_diag_dump.side_effect = lambda: [logger.info('diagnostic %d', i) for i in range(30)]
+
+    def check_log(*args, **kwargs):
+        with open(log_file) as f:
+            assert 'diagnostic 29' in f.read()
+    subprocess.call.side_effect = check_log
+
+    handler = get_file_handler(InsightsConfig(logging_file=log_file))
+    target = handler.target
+    logger = logging.getLogger('insights.client.support.test')
+    root_level = logging.root.level
+    logging.root.addHandler(handler)
+    logging.root.setLevel(logging.INFO)
+    try:
+        InsightsSupport(Mock()).collect_support_info()
+        subprocess.call.assert_called_once()
+    finally:
+        logging.root.removeHandler(handler)
+        logging.root.setLevel(root_level)
+        handler.close()
+        target.close()
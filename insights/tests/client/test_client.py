@@ -1,9 +1,12 @@
 import sys
 import os
+import logging
+import logging.handlers
 import pytest
 import time
 
 from insights.client import InsightsClient
+from insights.client import client as client_module
 from insights.client.archive import InsightsArchive
 from insights.client.config import InsightsConfig
 from insights import package_info
@@ -140,6 +143,64 @@ def test_force_reregister():
     assert old_reg_file2_ts != new_reg_file2_ts
 
 
+@patch('insights.client.client.write_registered_file')
+@patch('insights.client.support.write_registered_file')
+def test_registration_status_cached(support_write, client_write):
+    config = InsightsConfig(legacy_upload=False)
+    pconn = Mock(spec=['config', 'api_registration_check'], config=config,
+                 **{'api_registration_check.return_value': True})
+    assert client_module.get_registration_status(config, pconn) is True
+    assert client_module.get_registration_status(config, pconn) is True
+    pconn.api_registration_check.assert_called_once()
+    # the cached hit still resyncs the local record
+    support_write.assert_called_once_with()
+    client_write.assert_called_once_with()
+
+
+@patch('insights.client.client.write_unregistered_file')
+@patch('insights.client.support.write_unregistered_file')
+def test_registration_status_cache_hit_resyncs_unregistered(support_write, client_write):
+    config = InsightsConfig(legacy_upload=False)
+    pconn = Mock(spec=['config', 'api_registration_check'], config=config,
+                 **{'api_registration_check.return_value': False})
+    assert client_module.get_registration_status(config, pconn) is False
+    assert client_module.get_registration_status(config, pconn) is False
+    pconn.api_registration_check.assert_called_once()
+    client_write.assert_called_once_with()
+
+
+@patch('insights.client.reset_registration_state')
+@patch('insights.client.generate_machine_id')
+def test_clear_local_registration_clears_cached_status(generate_machine_id, reset_registration_state):
+    config = InsightsConfig()
+    client = InsightsClient(config)
+    client.connection = Mock(_cached_reg_check=(0, True))
+    client.clear_local_registration()
+    reset_registration_state.assert_called_once_with()
+    assert client.connection._cached_reg_check is None
+
+
+def test_registration_status_unreachable_not_cached():
+    config = InsightsConfig(legacy_upload=False)
+    pconn = Mock(spec=['config', 'api_registration_check'], config=config,
+                 **{'api_registration_check.return_value': None})
+    with patch('insights.client.support.write_unregistered_file'):
+        assert client_module.get_registration_status(config, pconn) is None
+        assert client_module.get_registration_status(config, pconn) is None
+    assert pconn.api_registration_check.call_count == 2
+
+
+@patch('insights.client.client.REG_CHECK_TTL', 0)
+def test_registration_status_cache_expires():
+    config = InsightsConfig(legacy_upload=False)
+    pconn = Mock(spec=['config', 'api_registration_check'], config=config,
+                 **{'api_registration_check.return_value': True})
+    with patch('insights.client.support.write_registered_file'):
+        client_module.get_registration_status(config, pconn)
+        client_module.get_registration_status(config, pconn)
+    assert pconn.api_registration_check.call_count == 2
+
+
 def test_register_container():
     with pytest.raises(ValueError):
         InsightsConfig(register=True, analyze_container=True)
@@ -285,6 +346,110 @@ def test_upload_500_retry(_, upload_archive):
         sys.argv = tmp
 
 
+@mark.parametrize("legacy_upload", [False, True])
+@mark.parametrize("status_code", [408, 429, 500, 503])
+@patch('insights.client.client.time.sleep')
+@patch('insights.client.client.InsightsConnection.upload_archive')
+@patch('insights.client.os.path.exists', return_value=True)
+def test_upload_retry_backoff(_, upload_archive, sleep, status_code, legacy_upload):
+
+    # Hack to prevent client from parsing args to py.test
+    tmp = sys.argv
+    sys.argv = []
+
+    try:
+        upload_archive.return_value = Mock(status_code=status_code)
+        config = InsightsConfig(logging_file='/tmp/insights.log', retries=4,
+                                legacy_upload=legacy_upload)
+        client = InsightsClient(config)
+        with pytest.raises(RuntimeError):
+            client.upload('/tmp/insights.tar.gz')
+
+        assert upload_archive.call_count == 4
+        # no wait after the last attempt
+        assert sleep.call_count == 3
+        waits = [c[0][0] for c in sleep.call_args_list]
+        for tries, wait in enumerate(waits):
+            assert 0 <= wait <= client_module.RETRY_BACKOFF_BASE * 2 ** tries
+    finally:
+        sys.argv = tmp
+
+
+@patch('insights.client.client.time.sleep')
+@patch('insights.client.client._monotonic', side_effect=[0, 5, 11])
+@patch('insights.client.client.InsightsConnection.upload_archive',
+       return_value=Mock(status_code=500))
+@patch('insights.client.os.path.exists', return_value=True)
+def test_upload_deadline_exceeded(_, upload_archive, monotonic, sleep):
+
+    # Hack to prevent client from parsing args to py.test
+    tmp = sys.argv
+    sys.argv = []
+
+    try:
+        config = InsightsConfig(logging_file='/tmp/insights.log', retries=5, upload_deadline=10)
+        client = InsightsClient(config)
+        with pytest.raises(RuntimeError) as e:
+            client.upload('/tmp/insights.tar.gz')
+
+        assert 'deadline' in str(e.value)
+        # deadline reached after the second attempt
+        assert upload_archive.call_count == 2
+        assert sleep.call_count == 1
+        # the wait never runs past the 5 seconds that were left
+        assert sleep.call_args[0][0] <= 5
+    finally:
+        sys.argv = tmp
+
+
+def test_backoff_capped_at_sleep_time():
+    for attempt in range(20):
+        assert 0 <= client_module._backoff(attempt) <= constants.sleep_time
+
+
+@mark.parametrize("legacy_upload", [False, True])
+@mark.parametrize("status_code", [400, 401, 403, 404])
+@patch('insights.client.client.time.sleep')
+@patch('insights.client.client.InsightsConnection.handle_fail_rcs')
+@patch('insights.client.client.InsightsConnection.upload_archive')
+@patch('insights.client.os.path.exists', return_value=True)
+def test_upload_4xx_no_retry(_, upload_archive, handle_fail_rcs, sleep, status_code, legacy_upload):
+
+    # Hack to prevent client from parsing args to py.test
+    tmp = sys.argv
+    sys.argv = []
+
+    try:
+        upload_archive.return_value = Mock(status_code=status_code)
+        config = InsightsConfig(logging_file='/tmp/insights.log', retries=3,
+                                legacy_upload=legacy_upload)
+        client = InsightsClient(config)
+        with pytest.raises(RuntimeError):
+            client.upload('/tmp/insights.tar.gz')
+
+        upload_archive.assert_called_once()
+        handle_fail_rcs.assert_called_once()
+        sleep.assert_not_called()
+    finally:
+        sys.argv = tmp
+
+
+@patch('insights.client.client.write_to_disk')
+def test_legacy_upload_writes_results(write_to_disk, tmpdir):
+    results_file = str(tmpdir.join('.last-upload.results'))
+    content = u'{"display_name": "caf\u00e9"}'.encode('utf-8')
+    config = InsightsConfig(legacy_upload=True, retries=1)
+    config.account_number = None
+    pconn = Mock(**{'upload_archive.return_value': Mock(status_code=201, content=content)})
+    with patch('insights.client.client.constants.last_upload_results_file', results_file):
+        api_response = client_module._legacy_upload(config, pconn, '/tmp/insights.tar.gz', '')
+
+    assert api_response == {'display_name': u'caf\u00e9'}
+    with open(results_file, 'rb') as f:
+        assert f.read() == content
+    write_to_disk.assert_called_once_with(constants.lastupload_file)
+
+
 @patch('insights.client.client.InsightsConnection.handle_fail_rcs')
 @patch('insights.client.client.InsightsConnection.upload_archive',
        return_value=Mock(status_code=412))
@@ -654,3 +819,114 @@ def test_checkin_offline():
     result = client.checkin()
     assert result is None
     client.connection.checkin.assert_not_called()
+
+
+@patch('insights.client.client.atexit.register')
+def test_file_handler_is_buffered(atexit_register, tmpdir):
+    log_file = str(tmpdir.join('insights.log'))
+    config = InsightsConfig(logging_file=log_file)
+    handler = client_module.get_file_handler(config)
+    target = handler.target
+    try:
+        assert isinstance(handler, logging.handlers.MemoryHandler)
+        assert isinstance(target, logging.handlers.RotatingFileHandler)
+        atexit_register.assert_called_once_with(handler.flush)
+
+        handler.handle(logging.makeLogRecord({'msg': 'buffered', 'levelno': logging.INFO}))
+        assert 'buffered' not in open(log_file).read()
+        handler.flush()
+        assert 'buffered' in open(log_file).read()
+    finally:
+        handler.close()
+        target.close()
+
+
+@mark.parametrize(("net_debug", "verbose", "expected"), [
+    (True, False, client_module.NETWORK),
+    (False, True, logging.DEBUG),
+    (True, True, logging.DEBUG),
+    (False, False, logging.INFO),
+])
+def test_configure_level(net_debug, verbose, expected):
+    config = InsightsConfig(net_debug=net_debug, verbose=verbose, loglevel='INFO')
+    logging.addLevelName(client_module.NETWORK, "NETWORK")
+    root_level = logging.root.level
+    logger_level = client_module.logger.level
+    dr_level = logging.getLogger('insights.core.dr').level
+    try:
+        client_module.configure_level(config)
+        assert client_module.logger.level == expected
+        assert logging.root.level == expected
+    finally:
+        logging.root.setLevel(root_level)
+        client_module.logger.setLevel(logger_level)
+        logging.getLogger('insights.core.dr').setLevel(dr_level)
+
+
+def test_console_handler_formatters():
+    verbose = client_module.get_console_handler(InsightsConfig(verbose=True))
+    terse = client_module.get_console_handler(InsightsConfig())
+    assert verbose.formatter is client_module._VERBOSE_FMT
+    assert terse.formatter is client_module._TERSE_FMT
+    assert client_module.get_console_handler(InsightsConfig()).formatter is terse.formatter
+
+
+@patch('insights.client.client.atexit.register', Mock())
+def test_file_handler_creates_log_dir(tmpdir):
+    log_dir = tmpdir.join('log')
+    config = InsightsConfig(logging_file=str(log_dir.join('insights.log')))
+    for _ in range(2):
+        # second call finds the directory already there
+        handler = client_module.get_file_handler(config)
+        handler.target.close()
+        assert log_dir.check(dir=True)
+    assert oct(log_dir.stat().mode & 0o777) == oct(0o700)
+
+
+@mark.parametrize("offline", [True, False])
+def test_get_branch_info_returns_same_object(offline):
+    config = InsightsConfig(offline=offline)
+    config.branch_info = {'remote_branch': 0, 'remote_leaf': 1}
+    client = InsightsClient(config)
+    client.connection = Mock()
+    client.session = True
+    branch_info = client_module.get_branch_info(config)
+    assert client_module.get_branch_info(config) is branch_info
+    assert client.branch_info() is branch_info
+    if offline:
+        assert branch_info is constants.default_branch_info
+    else:
+        assert branch_info is config.branch_info
+
+
+@mark.parametrize("loglevel", ['BOGUS', u'BOGUS'])
+def test_configure_level_invalid(loglevel):
+    config = InsightsConfig(loglevel='INFO')
+    config.loglevel = loglevel
+    root_level = logging.root.level
+    logger_level = client_module.logger.level
+    dr_level = logging.getLogger('insights.core.dr').level
+    try:
+        client_module.configure_level(config)
+        assert client_module.logger.level == logging.DEBUG
+    finally:
+        logging.root.setLevel(root_level)
+        client_module.logger.setLevel(logger_level)
+        logging.getLogger('insights.core.dr').setLevel(dr_level)
+
+
+@patch('insights.client.client.atexit.register', Mock())
+def test_do_log_rotation(tmpdir):
+    log_file = str(tmpdir.join('insights.log'))
+    handler = client_module.get_file_handler(InsightsConfig(logging_file=log_file))
+    target = handler.target
+    logging.root.addHandler(handler)
+    try:
+        handler.handle(logging.makeLogRecord({'msg': 'before rotation', 'levelno': logging.INFO}))
+        client_module.do_log_rotation()
+        with open(log_file + '.1') as f:
+            assert 'before rotation' in f.read()
+    finally:
+        logging.root.removeHandler(handler)
+        handler.close()
+        target.close()
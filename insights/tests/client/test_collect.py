@@ -1,7 +1,7 @@
 # -*- coding: UTF-8 -*-
 
 from contextlib import contextmanager
-from insights.client.client import collect
+from insights.client.client import collect, _call_concurrently
 from insights.client.config import InsightsConfig
 from insights.client.data_collector import DataCollector
 from json import dump as json_dump, dumps as json_dumps
@@ -387,3 +387,15 @@ def test_cmd_blacklist():
     assert dc._blacklist_check('echo ""; shutdown')
     assert dc._blacklist_check('/bin/bash -c "rm -rf /"')
     assert dc._blacklist_check('echo ""; /bin/bash -c "rm -rf /"; reboot')
+
+
+def test_call_concurrently_keeps_order():
+    assert _call_concurrently(lambda: 1, lambda: 2) == [1, 2]
+
+
+def test_call_concurrently_raises():
+    def fail():
+        raise RuntimeError("ERROR: Unable to download conf or read it from disk!")
+
+    with raises(RuntimeError):
+        _call_concurrently(lambda: None, fail)
@@ -65,7 +65,8 @@ def test_defaults():
 @patch('insights.client.config.os.environ', {
         'INSIGHTS_HTTP_TIMEOUT': '1234',
         'INSIGHTS_RETRIES': '1234',
-        'INSIGHTS_CMD_TIMEOUT': '1234'
+        'INSIGHTS_CMD_TIMEOUT': '1234',
+        'INSIGHTS_UPLOAD_DEADLINE': '1234'
        })
 def test_env_number_parsing():
     c = InsightsConfig()
@@ -73,6 +74,7 @@ def test_env_number_parsing():
     assert isinstance(c.cmd_timeout, int)
     assert isinstance(c.retries, int)
     assert isinstance(c.http_timeout, float)
+    assert isinstance(c.upload_deadline, float)
 
 
 @patch('insights.client.config.os.environ', {
@@ -174,6 +174,36 @@ def test_delete_unregistered_file():
         assert os.path.isfile(u) is False
 
 
+@patch('insights.client.utilities.constants.registered_files',
+       ['/tmp/insights-client.registered',
+        '/tmp/redhat-access-insights.registered'])
+@patch('insights.client.utilities.constants.unregistered_files',
+       ['/tmp/insights-client.unregistered',
+        '/tmp/redhat-access-insights.unregistered'])
+@patch('insights.client.utilities.constants.machine_id_file',
+       '/tmp/machine-id')
+def test_reset_registration_state():
+    util.write_registered_file()
+    util.write_to_disk(constants.unregistered_files[0])
+    util.write_to_disk(constants.machine_id_file)
+    util.reset_registration_state()
+    for r in constants.registered_files:
+        assert os.path.isfile(r) is False
+    for u in constants.unregistered_files:
+        assert os.path.isfile(u) is False
+    assert os.path.isfile(constants.machine_id_file) is False
+
+
+@patch('insights.client.utilities.constants.registered_files',
+       ['/tmp/nonexistent-insights-dir/.registered'])
+@patch('insights.client.utilities.constants.unregistered_files',
+       ['/tmp/nonexistent-insights-dir/.unregistered'])
+@patch('insights.client.utilities.constants.machine_id_file',
+       '/tmp/nonexistent-insights-dir/machine-id')
+def test_reset_registration_state_no_dir():
+    util.reset_registration_state()
+
+
 def test_read_pidfile():
     '''
     Test a pidfile that exists